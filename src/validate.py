@@ -1,15 +1,32 @@
+import errno
+import hashlib
 import logging
+import mmap
 import os
 import re
 import subprocess
-import tarfile
+import threading
 import traceback
+from concurrent.futures import (FIRST_EXCEPTION, CancelledError,
+                                ThreadPoolExecutor, wait)
+from functools import partial
 from pathlib import Path
-from shutil import copytree, rmtree
+from shutil import copyfileobj, copytree, rmtree, which
+from tempfile import TemporaryFile
 
 import bagit
 import boto3
+import botocore.session
 from aws_assume_role_lib import assume_role
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+try:
+    from s3transfer.crt import (BotocoreCRTCredentialsWrapper,
+                                BotocoreCRTRequestSerializer,
+                                CRTTransferManager, create_s3_crt_client)
+except ImportError:
+    CRTTransferManager = None
 
 logging.basicConfig(
     level=int(os.environ.get('LOGGING_LEVEL', logging.INFO)),
@@ -17,6 +34,41 @@ logging.basicConfig(
 logging.getLogger("bagit").setLevel(logging.ERROR)
 
 
+def checksum_validation_enabled(value):
+    """Returns whether payload checksums should be verified.
+
+    Only an explicit "false" disables verification, so a mistyped setting
+    cannot silently switch off fixity checks.
+
+    Args:
+        value (string): value of the FULL_CHECKSUM_VALIDATION setting.
+    """
+    return value.strip().lower() != 'false'
+
+
+CPU_COUNT = os.cpu_count() or 1
+S3_CHUNK_SIZE = int(os.environ.get('S3_CHUNK_MB', 8)) * 1024 * 1024
+S3_MAX_CONCURRENCY = int(
+    os.environ.get('S3_CONCURRENCY', max(10, CPU_COUNT * 2)))
+BOTO_SESSION = boto3.Session()
+FULL_CHECKSUM_VALIDATION = checksum_validation_enabled(
+    os.environ.get('FULL_CHECKSUM_VALIDATION', 'true'))
+STREAM_EXTRACT = os.environ.get('STREAM_EXTRACT', 'false').lower() == 'true'
+STREAM_BUFFER_SIZE = 4 * 1024 * 1024
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+CLIENT_CONFIG = Config(
+    max_pool_connections=S3_MAX_CONCURRENCY,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    tcp_keepalive=True)
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_CHUNK_SIZE,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    multipart_chunksize=S3_CHUNK_SIZE,
+    max_io_queue=1000,
+    io_chunksize=1024 * 1024,
+    use_threads=True)
+
+
 class RefidError(Exception):
     pass
 
@@ -40,6 +92,23 @@ class AlreadyExistsError(Exception):
 class Validator(object):
     """Validates digitized audio and moving image assets."""
 
+    REFID_PATTERN = re.compile(r"[a-zA-Z0-9]{32}")
+    POLICY_PATHS = {
+        suffix: str(Path('mediaconch', 'policies', policy)) for suffix, policy in {
+            '.mp3': 'RAC_Audio_A_MP3.xml',
+            '.wav': 'RAC_Audio_MA_WAV.xml',
+            '.mp4': 'RAC_Video_A_MP4.xml',
+            '.mkv': 'RAC_Video_MA_FFV1MKV.xml',
+            '.mov': 'RAC_Video_MEZZ_ProRes.xml', }.items()}
+    COMPRESSION_FLAGS = {
+        b'\x1f\x8b': '--gzip',
+        b'BZh': '--bzip2',
+        b'\xfd7zXZ\x00': '--xz'}
+    EXPECTED_SUFFIXES = {
+        'audio': ('.mp3', '.wav'),
+        'video': ('.mkv', '.mov', '.mp4')}
+    MASTER_SUFFIXES = {'audio': '.wav', 'video': '.mkv'}
+
     def __init__(self, region, role_arn, format, source_bucket,
                  destination_dir, source_filename, tmp_dir, sns_topic):
         self.role_arn = role_arn
@@ -52,94 +121,319 @@ class Validator(object):
         self.tmp_dir = tmp_dir
         self.sns_topic = sns_topic
         self.service_name = 'digitized_av_validation'
-        if self.format not in ['audio', 'video']:
+        self.assumed_role_session = None
+        self.clients = {}
+        self.crt_transfer_manager = None
+        self.checks_cancelled = threading.Event()
+        if self.format not in self.EXPECTED_SUFFIXES:
             raise Exception(f"Cannot process file with format {self.format}.")
         if not Path(self.tmp_dir).is_dir():
             Path(self.tmp_dir).mkdir(parents=True)
-        logging.debug(self.__dict__)
+        logging.debug('%r', self.__dict__)
 
     def run(self):
         """Main method which calls all other logic."""
         logging.debug(
-            f'Validation process started for {self.format} package {self.refid}.')
+            'Validation process started for %s package %s.', self.format, self.refid)
         try:
             extracted = Path(self.tmp_dir, self.refid)
             self.validate_refid(self.refid)
-            downloaded = self.download_bag()
-            self.extract_bag(downloaded)
-            self.validate_bag(extracted)
-            self.validate_assets(extracted)
-            self.validate_file_formats(extracted)
+            source = self.stream_bag() if STREAM_EXTRACT else self.download_bag()
+            self.extract_bag(source)
+            bag = self.validate_bag_structure(extracted)
+            payload_files = self.get_payload_files(extracted)
+            self.validate_assets(extracted, payload_files)
+            self.validate_contents(bag, extracted, payload_files)
             self.move_to_destination(extracted)
             self.cleanup_binaries(extracted)
             self.deliver_success_notification()
             logging.info(
-                f'{self.format} package {self.refid} successfully validated.')
+                '%s package %s successfully validated.', self.format, self.refid)
         except Exception as e:
             logging.exception(e)
             self.cleanup_binaries(extracted, job_failed=True)
             self.deliver_failure_notification(e)
 
+    def get_session_with_role(self, role_arn):
+        """Gets Boto3 session which authenticates with a specific IAM role.
+
+        The role is only assumed once per Validator; the session refreshes its
+        credentials when they expire.
+        """
+        if not self.assumed_role_session:
+            self.assumed_role_session = assume_role(BOTO_SESSION, role_arn)
+        return self.assumed_role_session
+
     def get_client_with_role(self, resource, role_arn):
-        """Gets Boto3 client which authenticates with a specific IAM role."""
-        session = boto3.Session()
-        assumed_role_session = assume_role(session, role_arn)
-        return assumed_role_session.client(resource)
+        """Gets Boto3 client which authenticates with a specific IAM role.
+
+        Clients are cached so connections are reused across calls, and share a
+        connection pool sized to match S3 transfer concurrency.
+        """
+        if resource not in self.clients:
+            session = self.get_session_with_role(role_arn)
+            self.clients[resource] = session.client(
+                resource, region_name=self.region, config=CLIENT_CONFIG)
+        return self.clients[resource]
+
+    def get_crt_transfer_manager(self, role_arn):
+        """Gets AWS CRT transfer manager which authenticates with a specific IAM role.
+
+        Credentials are resolved through the assumed role session, so they are
+        refreshed by the CRT client during long-running transfers. The manager
+        is cached so its CRT client and event loop are reused across downloads.
+        """
+        if not self.crt_transfer_manager:
+            session = self.get_session_with_role(role_arn)
+            credentials = BotocoreCRTCredentialsWrapper(
+                session.get_credentials())
+            crt_client = create_s3_crt_client(
+                self.region,
+                crt_credentials_provider=credentials.to_crt_credentials_provider(),
+                part_size=S3_CHUNK_SIZE)
+            serializer = BotocoreCRTRequestSerializer(
+                botocore.session.Session(),
+                {'region_name': self.region})
+            self.crt_transfer_manager = CRTTransferManager(
+                crt_client, serializer)
+        return self.crt_transfer_manager
 
     def validate_refid(self, refid):
-        valid = re.compile(r"^[a-zA-Z0-9]{32}$")
-        if not bool(valid.match(refid)):
+        if not self.REFID_PATTERN.fullmatch(refid):
             raise RefidError(f"{refid} is not a valid refid.")
         return True
 
     def download_bag(self):
         """Downloads a streaming file from S3.
 
+        Uses the AWS CRT transfer manager, which parallelizes ranged GETs in
+        native code, if awscrt is installed.
+
         Returns:
             downloaded_path (pathlib.Path): path of the downloaded file.
         """
         downloaded_path = Path(self.tmp_dir, self.source_filename)
+        if CRTTransferManager:
+            manager = self.get_crt_transfer_manager(self.role_arn)
+            manager.download(
+                self.source_bucket,
+                self.source_filename,
+                str(downloaded_path)).result()
+            logging.debug('Package downloaded to %s.', downloaded_path)
+            return downloaded_path
         client = self.get_client_with_role('s3', self.role_arn)
-        transfer_config = boto3.s3.transfer.TransferConfig(
-            multipart_threshold=1024 * 25,
-            max_concurrency=10,
-            multipart_chunksize=1024 * 25,
-            use_threads=True)
         client.download_file(
             self.source_bucket,
             self.source_filename,
             downloaded_path,
-            Config=transfer_config)
-        logging.debug(f'Package downloaded to {downloaded_path}.')
+            Config=TRANSFER_CONFIG)
+        logging.debug('Package downloaded to %s.', downloaded_path)
         return downloaded_path
 
-    def extract_bag(self, file_path):
-        """Extracts the contents of a TAR file.
+    def stream_bag(self):
+        """Opens a streaming read of a file in S3.
+
+        Returns:
+            body (botocore.response.StreamingBody): body of the S3 object.
+        """
+        client = self.get_client_with_role('s3', self.role_arn)
+        response = client.get_object(
+            Bucket=self.source_bucket,
+            Key=self.source_filename)
+        logging.debug('Package %s opened for streaming.', self.source_filename)
+        return response['Body']
+
+    def get_decompression_flags(self, header):
+        """Gets tar flags needed to decompress an archive.
+
+        Gzip archives are decompressed with rapidgzip or pigz if either is
+        installed, since both inflate using multiple cores.
+
+        Args:
+            header (bytes): first bytes of the archive.
+
+        Returns:
+            flags (list of strings): tar command line flags.
+        """
+        if header.startswith(b'\x1f\x8b'):
+            for program in ['rapidgzip', 'pigz']:
+                if which(program):
+                    return [f'--use-compress-program={program}']
+        return [flag for magic, flag in self.COMPRESSION_FLAGS.items()
+                if header.startswith(magic)]
+
+    def extract_bag(self, source):
+        """Extracts the contents of a TAR file or stream with GNU tar.
+
+        Streams are piped to tar as they are read, so extraction overlaps
+        with the download and no intermediate file is written.
 
         Args:
-            file_path (pathlib.Path): path of compressed file to extract.
+            source (pathlib.Path or file object): path of compressed file to
+                extract, or a readable stream of its contents.
         """
+        command = ['tar', '--extract', '--directory', str(self.tmp_dir)]
         try:
-            tf = tarfile.open(file_path, "r:*")
-            tf.extractall(self.tmp_dir)
-            tf.close()
-            file_path.unlink()
-            logging.debug(f'Package {file_path} extracted to {self.tmp_dir}.')
+            with TemporaryFile() as errors:
+                if isinstance(source, Path):
+                    with open(source, 'rb') as f:
+                        header = f.read(6)
+                    command += self.get_decompression_flags(header)
+                    process = subprocess.Popen(
+                        command + ['--file', str(source)], stderr=errors)
+                else:
+                    header = source.read(6)
+                    command += self.get_decompression_flags(header)
+                    process = subprocess.Popen(
+                        command + ['--file', '-'],
+                        stdin=subprocess.PIPE,
+                        stderr=errors)
+                    streamed = False
+                    try:
+                        process.stdin.write(header)
+                        copyfileobj(source, process.stdin, STREAM_BUFFER_SIZE)
+                        process.stdin.flush()
+                        streamed = True
+                    except BrokenPipeError:
+                        # tar exited early, its error is raised below.
+                        streamed = True
+                    finally:
+                        if not streamed:
+                            process.kill()
+                        try:
+                            process.stdin.close()
+                        except BrokenPipeError:
+                            pass
+                        if not streamed:
+                            process.wait()
+                if process.wait() != 0:
+                    errors.seek(0)
+                    raise Exception(errors.read().decode().strip())
+            if isinstance(source, Path):
+                source.unlink()
+            logging.debug('Package %s extracted to %s.', source, self.tmp_dir)
         except Exception as e:
             raise ExtractError("Error extracting TAR file: {}".format(e))
 
-    def validate_bag(self, bag_path):
-        """Validates a bag.
+    def validate_bag_structure(self, bag_path):
+        """Validates a bag's structure, Payload-Oxum and completeness.
+
+        No payload files are read, so this is cheap enough to run before any
+        other check.
 
         Args:
             bag_path (pathlib.Path): path of bagit Bag to validate.
 
+        Returns:
+            bag (bagit.Bag): the validated bag.
+
         Raises:
             bagit.BagValidationError with the error in the `details` property.
         """
         bag = bagit.Bag(str(bag_path))
-        bag.validate()
-        logging.debug(f'Bag {bag_path} validated.')
+        bag.validate(completeness_only=True)
+        return bag
+
+    def validate_contents(self, bag, bag_path, payload_files=None):
+        """Verifies bag checksums and file formats concurrently.
+
+        Hashing and MediaConch share the available CPUs. When either check
+        fails, work the other has not started yet is cancelled and the first
+        error is raised. Checksum verification can be skipped entirely by
+        setting FULL_CHECKSUM_VALIDATION to false.
+
+        Args:
+            bag (bagit.Bag): bag to verify.
+            bag_path (pathlib.Path): path of bagit Bag containing assets.
+            payload_files (list of pathlib.Path objects): files in the payload
+                directory, listed from bag_path if not given.
+        """
+        checks = [
+            partial(self.validate_file_formats, bag_path, payload_files)]
+        if FULL_CHECKSUM_VALIDATION:
+            checks.append(partial(self.validate_checksums, bag))
+        max_workers = max(1, CPU_COUNT // len(checks))
+        try:
+            with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+                futures = [executor.submit(check, max_workers=max_workers)
+                           for check in checks]
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                failed = [future for future in done if future.exception()]
+                if failed:
+                    self.checks_cancelled.set()
+            if failed:
+                failed[0].result()
+        finally:
+            self.checks_cancelled.clear()
+        logging.debug('Bag %s validated.', bag_path)
+
+    def validate_checksums(self, bag, max_workers=CPU_COUNT):
+        """Verifies every file in a bag against the checksums in its manifests.
+
+        Files are hashed on a thread pool; hashlib releases the GIL while
+        digesting, so hashing runs in parallel without spawning processes.
+
+        Args:
+            bag (bagit.Bag): bag to verify.
+            max_workers (int): maximum number of files hashed at once.
+
+        Raises:
+            bagit.BagValidationError with ChecksumMismatch errors in the `details`
+                property, or if a file cannot be read.
+        """
+        def hash_entry(entry):
+            if self.checks_cancelled.is_set():
+                raise CancelledError()
+            rel_path, hashes = entry
+            algorithms = [alg for alg in hashes if alg in bag.algorithms]
+            filepath = Path(
+                bag.path, bag.normalized_filesystem_names.get(rel_path, rel_path))
+            try:
+                return rel_path, hashes, self.get_file_hashes(
+                    filepath, algorithms)
+            except (OSError, ValueError) as e:
+                raise bagit.BagValidationError(
+                    f'Could not read {filepath}: {e}')
+
+        with ThreadPoolExecutor(min(len(bag.entries), max_workers) or 1) as executor:
+            results = list(executor.map(hash_entry, bag.entries.items()))
+        errors = [
+            bagit.ChecksumMismatch(rel_path, alg, hashes[alg].lower(), found)
+            for rel_path, hashes, computed in results
+            for alg, found in computed.items()
+            if hashes[alg].lower() != found]
+        if errors:
+            raise bagit.BagValidationError('Bag validation failed', errors)
+
+    def get_file_hashes(self, filepath, algorithms):
+        """Computes digests of a file, reading it only once for all algorithms.
+
+        The file is memory-mapped and fed to every hasher a block at a time,
+        so each block is hashed while still in cache and never copied into a
+        Python buffer.
+
+        Args:
+            filepath (pathlib.Path): file to hash.
+            algorithms (list of strings): hashlib algorithm names.
+
+        Returns:
+            hashes (dict): hex digests keyed by algorithm.
+        """
+        hashers = {alg: hashlib.new(alg) for alg in algorithms}
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(view), HASH_BLOCK_SIZE):
+                            block = view[offset:offset + HASH_BLOCK_SIZE]
+                            for hasher in hashers.values():
+                                hasher.update(block)
+                            block.release()
+                    finally:
+                        view.release()
+        return {alg: hasher.hexdigest() for alg, hasher in hashers.items()}
 
     def get_expected_structure(self, master_files):
         """Return the files expected to be present in a bag's payload directory.
@@ -147,67 +441,76 @@ class Validator(object):
         Returns:
             expected_structure (list of strings): filenames expected to be present.
         """
-        if self.format == 'audio':
-            if len(master_files) > 1:
-                expected_structure = [f"{self.refid}.mp3"]
-                for i in range(1, len(master_files) + 1):
-                    expected_structure.append(
-                        f"{self.refid}_{str(i).zfill(2)}.wav")
-            else:
-                expected_structure = [
-                    f"{self.refid}.mp3",
-                    f"{self.refid}.wav"]
-        elif self.format == 'video':
+        if self.format == 'audio' and len(master_files) > 1:
+            expected_structure = [f"{self.refid}.mp3"]
+            for i in range(1, len(master_files) + 1):
+                expected_structure.append(
+                    f"{self.refid}_{str(i).zfill(2)}.wav")
+        else:
             expected_structure = [
-                f"{self.refid}.mkv",
-                f"{self.refid}.mov",
-                f"{self.refid}.mp4"]
+                f"{self.refid}{suffix}" for suffix in self.EXPECTED_SUFFIXES[self.format]]
         return expected_structure
 
-    def get_actual_structure(self, bag_path):
-        """Return the files present in a bag's payload directory
+    def get_payload_files(self, bag_path):
+        """Lists the files in a bag's payload directory.
+
+        The directory is read once, and the result passed to every check that
+        needs it.
 
         Args:
             bag_path (pathlib.Path): base directory of the bag
 
         Returns:
-            actual_structure (list of strings): filenames found in bag dir
+            payload_files (list of pathlib.Path objects): files in the payload directory.
+        """
+        with os.scandir(bag_path / 'data') as entries:
+            return [Path(e.path) for e in entries]
+
+    def get_actual_structure(self, payload_files):
+        """Return the files present in a bag's payload directory
+
+        Args:
+            payload_files (list of pathlib.Path objects): files in the payload directory.
+
+        Returns:
+            actual_structure (set of strings): filenames found in bag dir
         """
-        return [p.name for p in (bag_path / 'data').iterdir()]
+        return {f.name for f in payload_files}
 
-    def get_master_files(self, bag_path):
+    def get_master_files(self, payload_files):
         """Returns filepaths of master files in a bag.
 
         Args:
-            bag_path (pathlib.Path): base directory of the bag
+            payload_files (list of pathlib.Path objects): files in the payload directory.
 
         Returns:
             master_files (list of pathlib.Path objects): filepaths of master files.
         """
-        if self.format == 'audio':
-            master_files = (bag_path / 'data').glob('*.wav')
-        elif self.format == 'video':
-            master_files = (bag_path / 'data').glob('*.mkv')
-        return list(master_files)
+        suffix = self.MASTER_SUFFIXES[self.format]
+        return [f for f in payload_files if f.name.endswith(suffix)]
 
-    def validate_assets(self, bag_path):
+    def validate_assets(self, bag_path, payload_files=None):
         """Ensures that all expected files are present.
 
         Args:
             bag_path (pathlib.Path): path of bagit Bag containing assets.
+            payload_files (list of pathlib.Path objects): files in the payload
+                directory, listed from bag_path if not given.
 
         Raises:
             AssetValidationError if files delivered do not match expected files.
         """
-        master_files = self.get_master_files(bag_path)
-        expected_files = self.get_expected_structure(master_files)
-        actual_files = self.get_actual_structure(bag_path)
-        if set(expected_files) != set(actual_files):
+        if payload_files is None:
+            payload_files = self.get_payload_files(bag_path)
+        master_files = self.get_master_files(payload_files)
+        expected_files = set(self.get_expected_structure(master_files))
+        actual_files = self.get_actual_structure(payload_files)
+        if expected_files != actual_files:
             expected_files_display = '\n'.join(sorted(expected_files))
             actual_files_display = '\n'.join(sorted(actual_files))
             raise AssetValidationError(
                 f'The files delivered do not match what is expected.\n\nExpected files:\n<pre>{expected_files_display}</pre>\n\nActual files:\n<pre>{actual_files_display}</pre>')
-        logging.debug(f'Package {bag_path} contains all expected assets.')
+        logging.debug('Package %s contains all expected assets.', bag_path)
 
     def get_policy_path(self, filepath):
         """Gets path to Mediaconch policy based on filepath extension.
@@ -219,64 +522,95 @@ class Validator(object):
             policy_path (string): filepath of Mediaconch policy.
         """
         try:
-            policy_map = {
-                '.mp3': 'RAC_Audio_A_MP3.xml',
-                '.wav': 'RAC_Audio_MA_WAV.xml',
-                '.mp4': 'RAC_Video_A_MP4.xml',
-                '.mkv': 'RAC_Video_MA_FFV1MKV.xml',
-                '.mov': 'RAC_Video_MEZZ_ProRes.xml', }
-            policy = policy_map[filepath.suffix]
-            return str(Path('mediaconch', 'policies', policy))
+            return self.POLICY_PATHS[filepath.suffix]
         except KeyError:
             raise FileFormatValidationError(
                 f'No Mediaconch policy found for file {filepath}.')
 
-    def validate_file_formats(self, bag_path):
+    def validate_file_format(self, filepath):
+        """Checks a file against its MediaConch policy.
+
+        Args:
+            filepath (pathlib.Path): file to validate.
+
+        Returns:
+            report (string): MediaConch report if the file is invalid, otherwise None.
+        """
+        if self.checks_cancelled.is_set():
+            raise CancelledError()
+        policy_path = self.get_policy_path(filepath)
+        process = subprocess.run(['mediaconch',
+                                  '-p',
+                                  policy_path,
+                                  '-fs',
+                                  filepath],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+        if process.stdout.startswith(b'fail!'):
+            display_path = str(Path('mediaconch', 'display.xsl'))
+            report_process = subprocess.run(['mediaconch',
+                                             '-p',
+                                             policy_path,
+                                             '-d',
+                                             display_path,
+                                             filepath],
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL)
+            return report_process.stdout.decode()
+
+    def validate_file_formats(
+            self, bag_path, payload_files=None, max_workers=CPU_COUNT):
         """Ensures that files pass MediaConch validation rules.
 
+        Files are checked concurrently, since each MediaConch process is
+        single-threaded.
+
         Args:
             bag_path (pathlib.Path): path of bagit Bag containing assets.
+            payload_files (list of pathlib.Path objects): files in the payload
+                directory, listed from bag_path if not given.
+            max_workers (int): maximum number of MediaConch processes run at once.
+
+        Raises:
+            FileFormatValidationError listing every file which is not valid.
         """
-        for f in bag_path.glob('data/*'):
-            policy_path = self.get_policy_path(f)
-            process = subprocess.Popen(['mediaconch',
-                                        '-p',
-                                        policy_path,
-                                        '-fs',
-                                        f],
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-            out, _ = process.communicate()
-            if out.decode().startswith('fail!'):
-                display_path = str(Path('mediaconch', 'display.xsl'))
-                report_process = subprocess.Popen(['mediaconch',
-                                                   '-p',
-                                                   policy_path,
-                                                   '-d',
-                                                   display_path,
-                                                   f],
-                                                  stdout=subprocess.PIPE,
-                                                  stderr=subprocess.PIPE)
-                out, _ = report_process.communicate()
-                report = out.decode()
-                raise FileFormatValidationError(
-                    f"{str(f)} is not valid according to format policy\n<pre>{report}</pre>")
-        logging.debug(f'All file formats in {bag_path} are valid.')
+        files = payload_files
+        if files is None:
+            files = self.get_payload_files(bag_path)
+        with ThreadPoolExecutor(max_workers=min(len(files), max_workers) or 1) as executor:
+            reports = list(executor.map(self.validate_file_format, files))
+        errors = [
+            f"{str(f)} is not valid according to format policy\n<pre>{report}</pre>"
+            for f, report in zip(files, reports) if report]
+        if errors:
+            raise FileFormatValidationError('\n\n'.join(errors))
+        logging.debug('All file formats in %s are valid.', bag_path)
 
     def move_to_destination(self, bag_path):
         """"Moves validated assets to destination directory.
 
+        The payload directory is renamed when the destination is on the same
+        filesystem, and only copied when it is not.
+
         Args:
             bag_path (pathlib.Path): path of bagit Bag containing assets.
         """
         new_path = Path(self.destination_dir, self.refid)
         try:
-            copytree(Path(bag_path, 'data'), new_path)
+            if new_path.exists():
+                raise FileExistsError(new_path)
+            try:
+                new_path.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(Path(bag_path, 'data'), new_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                copytree(Path(bag_path, 'data'), new_path)
         except FileExistsError:
             raise AlreadyExistsError(
                 f'A package with refid {self.refid} is already waiting to be QCed.')
         logging.debug(
-            f'All files in payload directory of {bag_path} moved to destination.')
+            'All files in payload directory of %s moved to destination.', bag_path)
 
     def cleanup_binaries(self, bag_path, job_failed=False):
         """Removes binaries after completion of successful or failed job.
@@ -284,10 +618,10 @@ class Validator(object):
         Args:
             bag_path (pathlib.Path): path of bagit Bag containing assets.
         """
-        client = self.get_client_with_role('s3', self.role_arn)
         if bag_path.is_dir():
             rmtree(bag_path)
         if not job_failed:
+            client = self.get_client_with_role('s3', self.role_arn)
             client.delete_object(
                 Bucket=self.source_bucket,
                 Key=self.source_filename)
@@ -366,7 +700,9 @@ if __name__ == '__main__':
     sns_topic = os.environ.get('AWS_SNS_TOPIC')
 
     logging.debug(
-        f'Validator instantiated with arguments: {region} {role_arn} {format} {source_bucket} {destination_dir} {source_filename} {tmp_dir} {sns_topic}')
+        'Validator instantiated with arguments: %s %s %s %s %s %s %s %s',
+        region, role_arn, format, source_bucket, destination_dir,
+        source_filename, tmp_dir, sns_topic)
     Validator(
         region,
         role_arn,
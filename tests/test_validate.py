@@ -1,17 +1,23 @@
+import errno
+import hashlib
+import io
 import json
-import random
+import os
+import subprocess
 from pathlib import Path
-from shutil import copyfile, copytree, rmtree
-from unittest.mock import patch
+from shutil import copy2, copyfile, copytree, rmtree
+from unittest.mock import DEFAULT, patch
 
 import bagit
 import boto3
 import pytest
+from aws_assume_role_lib import assume_role
 from moto import mock_s3, mock_sns, mock_sqs, mock_sts
 from moto.core import DEFAULT_ACCOUNT_ID
 
 from src.validate import (AlreadyExistsError, AssetValidationError,
-                          FileFormatValidationError, RefidError, Validator)
+                          ExtractError, FileFormatValidationError, RefidError,
+                          Validator, checksum_validation_enabled)
 
 DEFAULT_ARGS = [
     'us-east-1',
@@ -34,6 +40,14 @@ VIDEO_ARGS = [
     'topic']
 
 
+def link_or_copy(src, dst):
+    """Hardlinks a fixture file, copying it if the link crosses filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        copy2(src, dst)
+
+
 @pytest.fixture(autouse=True)
 def setup_and_teardown():
     """Fixture to create and tear down dir before and after a test is run"""
@@ -72,32 +86,50 @@ def test_init():
         Validator(*invalid_args)
 
 
-@patch('src.validate.Validator.validate_refid')
-@patch('src.validate.Validator.download_bag')
-@patch('src.validate.Validator.extract_bag')
-@patch('src.validate.Validator.validate_bag')
-@patch('src.validate.Validator.validate_assets')
-@patch('src.validate.Validator.validate_file_formats')
-@patch('src.validate.Validator.move_to_destination')
-@patch('src.validate.Validator.cleanup_binaries')
-@patch('src.validate.Validator.deliver_success_notification')
-def test_run(mock_deliver, mock_cleanup, mock_move, mock_validate_formats,
-             mock_validate_assets, mock_validate_bag, mock_extract_bag, mock_download, mock_refid):
+def test_run():
     """Asserts correct methods are called by run method."""
     validator = Validator(*DEFAULT_ARGS)
     extracted_path = Path(validator.tmp_dir, validator.refid)
-    download_path = "foo"
-    mock_download.return_value = download_path
-    validator.run()
-    mock_deliver.assert_called_once_with()
-    mock_cleanup.assert_called_once_with(extracted_path)
-    mock_move.assert_called_once_with(extracted_path)
-    mock_validate_formats.assert_called_once_with(extracted_path)
-    mock_validate_assets.assert_called_once_with(extracted_path)
-    mock_validate_bag.assert_called_once_with(extracted_path)
-    mock_extract_bag.assert_called_once_with(download_path)
-    mock_download.assert_called_once_with()
-    mock_refid.assert_called_once_with(validator.refid)
+    stream = "bar"
+    with patch.multiple(
+            'src.validate.Validator',
+            validate_refid=DEFAULT,
+            download_bag=DEFAULT,
+            stream_bag=DEFAULT,
+            extract_bag=DEFAULT,
+            validate_bag_structure=DEFAULT,
+            get_payload_files=DEFAULT,
+            validate_assets=DEFAULT,
+            validate_contents=DEFAULT,
+            move_to_destination=DEFAULT,
+            cleanup_binaries=DEFAULT,
+            deliver_success_notification=DEFAULT) as mocks:
+        download_path = "foo"
+        mocks['download_bag'].return_value = download_path
+        validator.run()
+        mocks['deliver_success_notification'].assert_called_once_with()
+        mocks['cleanup_binaries'].assert_called_once_with(extracted_path)
+        mocks['move_to_destination'].assert_called_once_with(extracted_path)
+        payload_files = mocks['get_payload_files'].return_value
+        mocks['validate_contents'].assert_called_once_with(
+            mocks['validate_bag_structure'].return_value,
+            extracted_path,
+            payload_files)
+        mocks['validate_assets'].assert_called_once_with(
+            extracted_path, payload_files)
+        mocks['get_payload_files'].assert_called_once_with(extracted_path)
+        mocks['validate_bag_structure'].assert_called_once_with(extracted_path)
+        mocks['extract_bag'].assert_called_once_with(download_path)
+        mocks['download_bag'].assert_called_once_with()
+        mocks['stream_bag'].assert_not_called()
+        mocks['validate_refid'].assert_called_once_with(validator.refid)
+
+        mocks['extract_bag'].reset_mock()
+        mocks['stream_bag'].return_value = stream
+        with patch('src.validate.STREAM_EXTRACT', True):
+            validator.run()
+        mocks['extract_bag'].assert_called_once_with(stream)
+        mocks['stream_bag'].assert_called_once_with()
 
 
 @patch('src.validate.Validator.validate_refid')
@@ -113,6 +145,37 @@ def test_run_with_exception(mock_deliver, mock_cleanup, mock_refid):
     mock_deliver.assert_called_once_with(exception)
 
 
+@patch('src.validate.Validator.download_bag')
+@patch('src.validate.Validator.extract_bag')
+@patch('src.validate.Validator.validate_file_formats')
+@patch('src.validate.Validator.deliver_failure_notification')
+def test_run_without_payload(
+        mock_deliver, mock_formats, mock_extract, mock_download):
+    """Asserts a bag without a payload directory fails bag validation first."""
+    validator = Validator(*DEFAULT_ARGS)
+    fixture_path = Path("tests", "fixtures", validator.refid)
+    tmp_path = Path(validator.tmp_dir, validator.refid)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
+    rmtree(Path(tmp_path, 'data'))
+
+    validator.run()
+    assert isinstance(mock_deliver.call_args[0][0], bagit.BagValidationError)
+    mock_formats.assert_not_called()
+
+
+@mock_sts
+def test_get_client_with_role():
+    """Asserts the role is assumed once and clients are reused."""
+    validator = Validator(*DEFAULT_ARGS)
+    with patch('src.validate.assume_role', wraps=assume_role) as mock_assume:
+        s3 = validator.get_client_with_role('s3', validator.role_arn)
+        assert validator.get_client_with_role('s3', validator.role_arn) is s3
+        sns = validator.get_client_with_role('sns', validator.role_arn)
+        assert sns is not s3
+    assert s3.meta.config.retries['mode'] == 'adaptive'
+    mock_assume.assert_called_once()
+
+
 def test_validate_refid():
     """Asserts refID is validated."""
     validator = Validator(*DEFAULT_ARGS)
@@ -123,6 +186,7 @@ def test_validate_refid():
 
 @mock_s3
 @mock_sts
+@patch('src.validate.CRTTransferManager', None)
 def test_download_bag():
     """Asserts file is downloaded correctly."""
     validator = Validator(*DEFAULT_ARGS)
@@ -137,6 +201,75 @@ def test_download_bag():
     assert expected_path.is_file()
 
 
+@mock_sts
+def test_get_crt_transfer_manager():
+    """Asserts a CRT transfer manager is built once and reused."""
+    pytest.importorskip('awscrt')
+    from s3transfer.crt import CRTTransferManager
+
+    validator = Validator(*DEFAULT_ARGS)
+    manager = validator.get_crt_transfer_manager(validator.role_arn)
+    assert isinstance(manager, CRTTransferManager)
+    assert validator.get_crt_transfer_manager(validator.role_arn) is manager
+
+
+@patch('src.validate.Validator.get_crt_transfer_manager')
+def test_download_bag_crt(mock_manager):
+    """Asserts file is downloaded with CRT transfer manager when available."""
+    validator = Validator(*DEFAULT_ARGS)
+    expected_path = Path(validator.tmp_dir, validator.source_filename)
+    manager = mock_manager.return_value
+
+    with patch('src.validate.CRTTransferManager', object):
+        downloaded = validator.download_bag()
+    assert downloaded == expected_path
+    mock_manager.assert_called_once_with(validator.role_arn)
+    manager.download.assert_called_once_with(
+        validator.source_bucket,
+        validator.source_filename,
+        str(expected_path))
+
+
+@mock_s3
+@mock_sts
+def test_stream_bag():
+    """Asserts file is opened for streaming correctly."""
+    validator = Validator(*DEFAULT_ARGS)
+    bucket_name = validator.source_bucket
+    s3 = boto3.client('s3', region_name='us-east-1')
+    s3.create_bucket(Bucket=bucket_name)
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=validator.source_filename,
+        Body='foo')
+
+    stream = validator.stream_bag()
+    assert stream.read() == b'foo'
+    assert not Path(validator.tmp_dir, validator.source_filename).is_file()
+
+
+@mock_s3
+@mock_sts
+def test_stream_and_extract_bag():
+    """Asserts a bag streamed from S3 is extracted without writing the archive to disk."""
+    validator = Validator(*DEFAULT_ARGS)
+    fixture_path = Path(
+        "tests",
+        "fixtures",
+        "b90862f3baceaae3b7418c78f9d50d52.tar.gz")
+    s3 = boto3.client('s3', region_name='us-east-1')
+    s3.create_bucket(Bucket=validator.source_bucket)
+    s3.upload_file(
+        str(fixture_path),
+        validator.source_bucket,
+        validator.source_filename)
+
+    validator.extract_bag(validator.stream_bag())
+    assert Path(validator.tmp_dir, validator.refid).is_dir()
+    assert Path(validator.tmp_dir, validator.refid, 'bagit.txt').is_file()
+    assert list(Path(validator.tmp_dir).glob('*.tar.gz')) == []
+
+
 def test_extract_bag():
     """Asserts bag is extracted correctly and downloaded file is removed."""
     validator = Validator(*DEFAULT_ARGS)
@@ -151,8 +284,70 @@ def test_extract_bag():
     assert Path(validator.tmp_dir, validator.refid).is_dir()
     assert not tmp_path.is_file()
 
+    rmtree(Path(validator.tmp_dir, validator.refid))
+    with open(fixture_path, 'rb') as stream:
+        validator.extract_bag(stream)
+    assert Path(validator.tmp_dir, validator.refid).is_dir()
+
+
+def test_extract_bag_with_exception():
+    """Asserts ExtractError is raised when a bag cannot be extracted."""
+    validator = Validator(*DEFAULT_ARGS)
+    with pytest.raises(ExtractError):
+        validator.extract_bag(io.BytesIO(b'not a tar file'))
+
+
+def test_extract_bag_with_stream_error():
+    """Asserts tar is stopped when reading from the stream fails."""
+    class FailingStream(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell():
+                raise ConnectionResetError('Connection reset by peer')
+            return super().read(size)
+
+    validator = Validator(*DEFAULT_ARGS)
+    processes = []
+    real_popen = subprocess.Popen
+
+    def popen(*args, **kwargs):
+        processes.append(real_popen(*args, **kwargs))
+        return processes[-1]
+
+    with patch('src.validate.subprocess.Popen', side_effect=popen):
+        with pytest.raises(ExtractError):
+            validator.extract_bag(FailingStream(b'\x00' * 1024))
+    assert processes[0].args[-2:] == ['--file', '-']
+    assert isinstance(processes[0].stdin, io.BufferedWriter)
+    assert processes[0].returncode is not None
+
 
-def test_validate_bag():
+@patch('src.validate.which')
+def test_get_decompression_flags(mock_which):
+    """Asserts archives are decompressed with the fastest available program."""
+    validator = Validator(*DEFAULT_ARGS)
+    mock_which.return_value = None
+    for header, expected in [
+            (b'\x1f\x8b\x08\x00\x00\x00', ['--gzip']),
+            (b'BZh91A', ['--bzip2']),
+            (b'\xfd7zXZ\x00', ['--xz']),
+            (b'foobar', [])]:
+        assert validator.get_decompression_flags(header) == expected
+
+    mock_which.side_effect = lambda program: program == 'pigz'
+    assert validator.get_decompression_flags(
+        b'\x1f\x8b\x08\x00\x00\x00') == ['--use-compress-program=pigz']
+
+
+def test_checksum_validation_enabled():
+    """Asserts checksum validation is only disabled by an explicit false."""
+    for value in ['false', 'False', ' FALSE ']:
+        assert not checksum_validation_enabled(value)
+    for value in ['true', 'True', ' true', '1', 'yes', 'flase', '']:
+        assert checksum_validation_enabled(value)
+
+
+@patch('src.validate.subprocess.run')
+def test_validate_bag(mock_subprocess):
     """Asserts bag validation is successful or raises expected exceptions on failure."""
     validator = Validator(*DEFAULT_ARGS)
     fixture_path = Path(
@@ -161,12 +356,84 @@ def test_validate_bag():
         "b90862f3baceaae3b7418c78f9d50d52")
     tmp_path = Path(validator.tmp_dir, validator.refid)
     copytree(fixture_path, tmp_path)
-
-    validator.validate_bag(tmp_path)
+    mock_subprocess.return_value.stdout = b'pass! Everything is cool!'
+
+    def validate_bag():
+        bag = validator.validate_bag_structure(tmp_path)
+        validator.validate_contents(bag, tmp_path)
+
+    validate_bag()
+
+    master_file = Path(tmp_path, 'data', f'{validator.refid}.wav')
+    with open(master_file, 'r+b') as f:
+        f.write(b'\x00' * 4)
+    with patch('src.validate.FULL_CHECKSUM_VALIDATION', False):
+        validate_bag()
+    with pytest.raises(bagit.BagValidationError) as error:
+        validate_bag()
+    assert set(e.path for e in error.value.details) == {
+        f'data/{validator.refid}.wav'}
+
+    bag = bagit.Bag(str(tmp_path))
+    master_file.unlink()
+    with pytest.raises(bagit.BagValidationError) as error:
+        validator.validate_checksums(bag)
+    assert str(master_file) in str(error.value)
 
     rmtree(Path(tmp_path, 'data'))
     with pytest.raises(bagit.BagValidationError):
-        validator.validate_bag(tmp_path)
+        validator.validate_bag_structure(tmp_path)
+
+
+def test_validate_contents():
+    """Asserts checks run concurrently and stop once one of them fails."""
+    validator = Validator(*DEFAULT_ARGS)
+    fixture_path = Path("tests", "fixtures", validator.refid)
+    tmp_path = Path(validator.tmp_dir, validator.refid)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
+    bag = bagit.Bag(str(tmp_path))
+
+    with patch('src.validate.subprocess.run') as mock_subprocess:
+        mock_subprocess.return_value.stdout = b'pass! Everything is cool!'
+        validator.validate_contents(bag, tmp_path)
+        assert mock_subprocess.call_count == 2
+
+    def fail_checksums(bag, max_workers):
+        raise bagit.BagValidationError('Bag validation failed')
+
+    def wait_for_cancel(args, **kwargs):
+        validator.checks_cancelled.wait(5)
+        return subprocess.CompletedProcess(args, 0, stdout=b'pass!')
+
+    with patch('src.validate.CPU_COUNT', 2), \
+            patch('src.validate.Validator.validate_checksums', side_effect=fail_checksums), \
+            patch('src.validate.subprocess.run', side_effect=wait_for_cancel) as mock_subprocess:
+        with pytest.raises(bagit.BagValidationError):
+            validator.validate_contents(bag, tmp_path)
+    assert mock_subprocess.call_count < 2
+    assert not validator.checks_cancelled.is_set()
+
+
+def test_get_file_hashes():
+    """Asserts file hashes match hashlib digests, including for empty files."""
+    validator = Validator(*DEFAULT_ARGS)
+    fixture_path = Path(
+        "tests",
+        "fixtures",
+        "b90862f3baceaae3b7418c78f9d50d52",
+        "data",
+        "b90862f3baceaae3b7418c78f9d50d52.wav")
+    with patch('src.validate.HASH_BLOCK_SIZE', 4096):
+        hashes = validator.get_file_hashes(fixture_path, ['sha256', 'sha512'])
+    contents = fixture_path.read_bytes()
+    assert hashes == {
+        'sha256': hashlib.sha256(contents).hexdigest(),
+        'sha512': hashlib.sha512(contents).hexdigest()}
+
+    empty_path = Path(validator.tmp_dir, 'empty')
+    empty_path.touch()
+    assert validator.get_file_hashes(empty_path, ['sha256']) == {
+        'sha256': hashlib.sha256().hexdigest()}
 
 
 def test_validate_assets():
@@ -175,10 +442,15 @@ def test_validate_assets():
         validator = Validator(*args)
         fixture_path = Path("tests", "fixtures", validator.refid)
         tmp_path = Path(validator.tmp_dir, validator.refid)
-        copytree(fixture_path, tmp_path)
+        copytree(fixture_path, tmp_path, copy_function=link_or_copy)
 
         validator.validate_assets(tmp_path)
 
+        payload_files = sorted(validator.get_payload_files(tmp_path))
+        validator.validate_assets(tmp_path, payload_files)
+        with pytest.raises(AssetValidationError):
+            validator.validate_assets(tmp_path, payload_files[1:])
+
 
 def test_get_expected_structure():
     validator = Validator(*DEFAULT_ARGS)
@@ -217,11 +489,12 @@ def test_get_actual_structure():
         validator = Validator(*args)
         fixture_path = Path("tests", "fixtures", validator.refid)
         tmp_path = Path(validator.tmp_dir, validator.refid)
-        copytree(fixture_path, tmp_path)
+        copytree(fixture_path, tmp_path, copy_function=link_or_copy)
 
-        output = validator.get_actual_structure(tmp_path)
-        assert isinstance(output, list)
-        assert set(output) == set(outputs[validator.refid])
+        output = validator.get_actual_structure(
+            validator.get_payload_files(tmp_path))
+        assert isinstance(output, set)
+        assert output == set(outputs[validator.refid])
 
 
 def test_validate_assets_missing_file():
@@ -230,10 +503,10 @@ def test_validate_assets_missing_file():
         validator = Validator(*args)
         fixture_path = Path("tests", "fixtures", validator.refid)
         tmp_path = Path(validator.tmp_dir, validator.refid)
-        copytree(fixture_path, tmp_path)
+        copytree(fixture_path, tmp_path, copy_function=link_or_copy)
 
         files = list(tmp_path.glob('data/*'))
-        random.choice(files).unlink()
+        sorted(files)[0].unlink()
 
         with pytest.raises(AssetValidationError):
             validator.validate_assets(tmp_path)
@@ -252,22 +525,25 @@ def test_get_policy():
         validator.get_policy_path(Path("foo.txt"))
 
 
-@patch('src.validate.subprocess.Popen.communicate')
+@patch('src.validate.subprocess.run')
 def test_validate_file_formats(mock_subprocess):
     """Asserts file formats are validated as expected."""
     validator = Validator(*DEFAULT_ARGS)
     fixture_path = Path("tests", "fixtures", validator.refid)
     tmp_path = Path(validator.tmp_dir, validator.refid)
-    copytree(fixture_path, tmp_path)
-
-    mock_subprocess.return_value = (b'pass! Everything is cool!', b'')
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
+    mock_subprocess.return_value.stdout = b'pass! Everything is cool!'
     validator.validate_file_formats(tmp_path)
+    probed = set(str(c.args[0][-1]) for c in mock_subprocess.call_args_list)
+    assert probed == set(str(f) for f in tmp_path.glob('data/*'))
 
     error_string = "fail! This is an error!"
-    mock_subprocess.return_value = (b'fail! This is an error!', b'')
-    with pytest.raises(FileFormatValidationError):
-        error = validator.validate_file_formats(tmp_path)
-        assert error_string in error
+    mock_subprocess.return_value.stdout = b'fail! This is an error!'
+    with pytest.raises(FileFormatValidationError) as error:
+        validator.validate_file_formats(tmp_path)
+    assert error_string in str(error.value)
+    for f in tmp_path.glob('data/*'):
+        assert str(f) in str(error.value)
 
 
 def test_move_to_destination():
@@ -278,7 +554,7 @@ def test_move_to_destination():
         "fixtures",
         "b90862f3baceaae3b7418c78f9d50d52")
     tmp_path = Path(validator.tmp_dir, validator.refid)
-    copytree(fixture_path, tmp_path)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
 
     validator.move_to_destination(tmp_path)
     expected_paths = [
@@ -301,7 +577,7 @@ def test_move_to_destination_multiple_masters():
         "fixtures",
         "b90862f3baceaae3b7418c78f9d50d53")
     tmp_path = Path(validator.tmp_dir, validator.refid)
-    copytree(fixture_path, tmp_path)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
 
     validator.move_to_destination(tmp_path)
     expected_paths = [
@@ -316,15 +592,37 @@ def test_move_to_destination_multiple_masters():
     assert sorted(expected_paths) == sorted(found)
 
 
+@patch('src.validate.os.rename')
+def test_move_to_destination_across_filesystems(mock_rename):
+    """Asserts files are copied when destination is on another filesystem."""
+    mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+    validator = Validator(*DEFAULT_ARGS)
+    fixture_path = Path("tests", "fixtures", validator.refid)
+    tmp_path = Path(validator.tmp_dir, validator.refid)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
+
+    validator.move_to_destination(tmp_path)
+    found = Path(validator.destination_dir, validator.refid).glob('*')
+    assert sorted(p.name for p in found) == sorted(
+        p.name for p in (tmp_path / 'data').iterdir())
+
+
 @patch('src.validate.copytree')
-def test_move_to_destination_with_exception(mock_copytree):
+@patch('src.validate.os.rename')
+def test_move_to_destination_with_exception(mock_rename, mock_copytree):
     """Asserts correct exception is raised by validator."""
+    mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
     mock_copytree.side_effect = FileExistsError()
     validator = Validator(*DEFAULT_ARGS)
     tmp_path = Path(validator.tmp_dir, validator.refid)
     with pytest.raises(AlreadyExistsError):
         validator.move_to_destination(tmp_path)
 
+    Path(validator.destination_dir, validator.refid).mkdir()
+    with pytest.raises(AlreadyExistsError):
+        validator.move_to_destination(tmp_path)
+    mock_rename.assert_called_once()
+
 
 @mock_s3
 @mock_sts
@@ -339,7 +637,7 @@ def test_cleanup_binaries():
     s3 = boto3.client('s3', region_name='us-east-1')
     s3.create_bucket(Bucket=validator.source_bucket)
 
-    copytree(fixture_path, tmp_path)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
     s3.put_object(
         Bucket=validator.source_bucket,
         Key=validator.source_filename,
@@ -352,7 +650,7 @@ def test_cleanup_binaries():
         Prefix=validator.refid)['KeyCount']
     assert found == 0
 
-    copytree(fixture_path, tmp_path)
+    copytree(fixture_path, tmp_path, copy_function=link_or_copy)
     s3.put_object(
         Bucket=validator.source_bucket,
         Key=validator.source_filename,